@@ -1,5 +1,6 @@
 import os
-import re
+import string
+from functools import lru_cache
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
 from fastapi import HTTPException
@@ -13,11 +14,14 @@ if not DATABASE_URL:
     )
 
 # Get pool settings from environment with secure defaults
-DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
-DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "25"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "25"))
 DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
 DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
 
+# Rows per multi-VALUES INSERT when bulk writes are sent as executemany
+DB_INSERT_PAGE_SIZE = int(os.getenv("DB_INSERT_PAGE_SIZE", "1000"))
+
 # Create SQLAlchemy engine with configurable pooling parameters
 engine = create_engine(
     DATABASE_URL,
@@ -25,15 +29,36 @@ engine = create_engine(
     max_overflow=DB_MAX_OVERFLOW,
     pool_timeout=DB_POOL_TIMEOUT,
     pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,  # Detect connections dropped by the server before handing them out
+    pool_use_lifo=True,  # Reuse the most recent connection so idle ones can expire
+    executemany_mode="values_plus_batch",  # Page executemany UPDATE/DELETE with psycopg2's execute_batch too
+    insertmanyvalues_page_size=DB_INSERT_PAGE_SIZE,
     echo=False  # Never log SQL in production for security
 )
 
+# Base domain for tenant validation; tenants live at <tenant>.BASE_DOMAIN
+BASE_DOMAIN = os.getenv("BASE_DOMAIN", "gradeinsight.com")
+_TENANT_SUFFIX = f".{BASE_DOMAIN}"
+
+# Reserved subdomains that should not be allowed as tenants
+_RESERVED_SUBDOMAINS = frozenset({
+    "www", "api", "app", "mail", "email", "ftp", "ssh",
+    "test", "staging", "dev", "demo", "support", "help", "blog",
+    "docs", "status", "monitor", "cdn", "static", "assets"
+})
+
+# Characters allowed in a tenant subdomain
+_TENANT_CHARS = frozenset(string.ascii_lowercase + string.digits + "-")
+
 # SessionLocal factory for per-request DB sessions
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
     """
     FastAPI dependency that yields a new database session and ensures closure.
+    Kept synchronous: closing the session rolls back and returns its
+    connection to the pool, which is network I/O that must stay off the
+    event loop.
     """
     db: Session = SessionLocal()
     try:
@@ -41,42 +66,34 @@ def get_db():
     finally:
         db.close()
 
+@lru_cache(maxsize=1024)
 def get_tenant_from_host(host: str) -> str:
     """
     Extract tenant subdomain from host header safely.
     Raises HTTPException if host missing or invalid.
     Only allows lowercase letters, digits, and hyphens.
     Rejects reserved/dangerous subdomains.
+    Cached per host, since a deployment only ever sees a handful of hosts;
+    invalid hosts raise and are never cached.
     """
     if not host:
         raise HTTPException(status_code=400, detail="Missing Host header")
     
-    # Get base domain from environment for validation
-    base_domain = os.getenv("BASE_DOMAIN", "gradeinsight.com")
-    
-    # Validate host ends with our base domain
-    if not host.endswith(f".{base_domain}") and host != base_domain:
-        raise HTTPException(status_code=400, detail="Invalid host domain")
-    
     # Handle main domain (no subdomain)
-    if host == base_domain:
+    if host == BASE_DOMAIN:
         return "main"  # or however you want to handle the main domain
     
-    # Extract subdomain
-    subdomain = host.replace(f".{base_domain}", "").lower()
-    
-    # Reserved subdomains that should not be allowed as tenants
-    reserved_subdomains = {
-        "www", "api", "app", "mail", "email", "ftp", "ssh", 
-        "test", "staging", "dev", "demo", "support", "help", "blog",
-        "docs", "status", "monitor", "cdn", "static", "assets"
-    }
+    # Extract subdomain, validating host ends with our base domain
+    subdomain = host.removesuffix(_TENANT_SUFFIX)
+    if subdomain == host:
+        raise HTTPException(status_code=400, detail="Invalid host domain")
+    subdomain = subdomain.lower()
     
-    if subdomain in reserved_subdomains:
+    if subdomain in _RESERVED_SUBDOMAINS:
         raise HTTPException(status_code=400, detail="Reserved subdomain not allowed")
     
     # Restrict tenant to alphanumeric + hyphen, 3-63 chars (DNS limits)
-    if not re.fullmatch(r"[a-z0-9\-]{3,63}", subdomain):
+    if not 3 <= len(subdomain) <= 63 or not _TENANT_CHARS.issuperset(subdomain):
         raise HTTPException(
             status_code=400, 
             detail="Invalid tenant: must be 3-63 characters, alphanumeric and hyphens only"
@@ -0,0 +1,79 @@
+"""
+Create any missing database tables and bring existing ones up to date.
+Run once per deploy, before the app starts, so web workers never issue
+DDL themselves:
+
+    python -m app.init_db
+"""
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.models import Base
+
+# Changes create_all does not make to tables that already exist. Each one
+# is idempotent, so all of them run on every start.
+SCHEMA_UPGRADES = [
+    "ALTER TABLE tenants ADD COLUMN IF NOT EXISTS data_version INTEGER NOT NULL DEFAULT 0",
+    # updated_at is stamped by the database, so rows inserted without it
+    # need the column default
+    *(
+        f"ALTER TABLE {table} ALTER COLUMN updated_at SET DEFAULT timezone('UTC', now())"
+        for table in ("tenants", "students", "teachers", "assignments", "grades")
+    ),
+    # Conflict target of the upload's assignment insert
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_assignment_tenant_name ON assignments (tenant_id, name)",
+    # Conflict target of the upload's tag insert, and the upload's teacher lookup
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_tag_tenant_name ON tags (tenant_id, name)",
+    "CREATE INDEX IF NOT EXISTS ix_teacher_tenant_name ON teachers (tenant_id, name)",
+    # Per-tenant grade scans and per-assignment stats
+    "CREATE INDEX IF NOT EXISTS ix_grade_tenant_assignment ON grades (tenant_id, assignment_id)",
+]
+
+# Student emails are stored trimmed and lowercased, but older uploads kept
+# them as typed. Students whose emails only differ in case or surrounding
+# spaces are merged into the oldest one, keeping the most recently updated
+# grade per assignment, and then every email is normalized. A no-op once
+# the data is clean.
+DATA_UPGRADES = [
+    """
+    CREATE TEMP TABLE student_merge ON COMMIT DROP AS
+    SELECT id, keep_id FROM (
+        SELECT id,
+               min(id) OVER w AS keep_id,
+               count(*) OVER w AS copies
+        FROM students
+        WINDOW w AS (PARTITION BY tenant_id, lower(btrim(email)))
+    ) s
+    WHERE copies > 1 AND id <> keep_id
+    """,
+    """
+    DELETE FROM grades
+    WHERE id IN (
+        SELECT id FROM (
+            SELECT g.id, row_number() OVER (
+                PARTITION BY g.tenant_id, g.assignment_id, coalesce(m.keep_id, g.student_id)
+                ORDER BY g.updated_at DESC NULLS LAST, g.id DESC
+            ) AS rank
+            FROM grades g
+            LEFT JOIN student_merge m ON m.id = g.student_id
+            WHERE g.student_id IN (SELECT id FROM student_merge UNION SELECT keep_id FROM student_merge)
+        ) ranked
+        WHERE rank > 1
+    )
+    """,
+    "UPDATE grades g SET student_id = m.keep_id FROM student_merge m WHERE g.student_id = m.id",
+    "DELETE FROM students s USING student_merge m WHERE s.id = m.id",
+    "UPDATE students SET email = lower(btrim(email)) WHERE email <> lower(btrim(email))",
+]
+
+
+def create_tables():
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for statement in SCHEMA_UPGRADES + DATA_UPGRADES:
+            conn.execute(text(statement))
+
+
+if __name__ == "__main__":
+    create_tables()
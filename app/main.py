@@ -1,82 +1,282 @@
+import csv
+import hashlib
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import io
 import os
 import re
 import logging
+import threading
 import traceback
-import email_validator
 
 from fastapi import FastAPI, Request, HTTPException, Depends, File, UploadFile, Form, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, Response
+from fastapi.responses import HTMLResponse, Response, ORJSONResponse, StreamingResponse
 from fastapi import HTTPException  
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_
-from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select, exists, lambda_stmt
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, EmailStr, validator, Field
 from contextlib import contextmanager
+from collections import OrderedDict
 
-from app.database import get_db, get_tenant_from_host, engine
-from app.models import Grade, Student, Teacher, Assignment, Tenant, Base
+from app.database import get_db, get_tenant_from_host
+from app.models import Grade, Student, Teacher, Assignment, Tenant, Tag, assignment_tags, UTC_NOW
 
 from services.student_service import StudentService
 from services.assignment_service import AssignmentService
 from services.csv_processor import CSVProcessor
+from utils.exceptions import ValidationError, ProcessingError
+from utils.validators import EMAIL_RE, validate_email
 
-app = FastAPI(title="Grade Insight")
+app = FastAPI(title="Grade Insight", default_response_class=ORJSONResponse)
 
-# Create tables on startup
-def create_tables():
-    Base.metadata.create_all(bind=engine)
+# Grade JSON and CSV exports repeat the same keys and names on every row and
+# compress well; a mid compression level keeps the CPU cost per response low
+app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=5)
+
+# Largest request body accepted, which bounds the size of an uploaded CSV
+MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE_MB", "50")) * 1024 * 1024
+
+
+class BodySizeLimitMiddleware:
+    """Reject requests whose Content-Length exceeds MAX_FILE_SIZE before any of the body is read"""
+    
+    def __init__(self, app, max_size: int):
+        self.app = app
+        self.max_size = max_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            length = dict(scope["headers"]).get(b"content-length", b"")
+            if length.isdigit() and int(length) > self.max_size:
+                response = ORJSONResponse(
+                    status_code=413,
+                    content={"detail": f"File size exceeds {self.max_size // (1024 * 1024)}MB limit"}
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(BodySizeLimitMiddleware, max_size=MAX_FILE_SIZE)
+
+logger = logging.getLogger(__name__)
+
+
+@app.exception_handler(SQLAlchemyError)
+async def database_error_handler(request: Request, exc: SQLAlchemyError):
+    # Log the details server-side; clients get a generic message. The
+    # request's session is rolled back when get_db closes it.
+    logger.exception("Database error on %s %s", request.method, request.url.path)
+    return ORJSONResponse(status_code=500, content={"detail": "Database error"})
+
+
+@app.exception_handler(ValidationError)
+@app.exception_handler(ProcessingError)
+async def csv_error_handler(request: Request, exc: Exception):
+    # CSVProcessor raises these for bad files, e.g. missing headers
+    return ORJSONResponse(status_code=400, content={"detail": exc.message})
 
-create_tables()
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
 
+# Templates only change on deploy, so skip the per-render mtime check unless debugging
+templates = Jinja2Templates(
+    directory="templates",
+    auto_reload=os.getenv("DEBUG", "false").lower() == "true",
+    cache_size=400
+)
 
-def get_or_create_tenant(db: Session, tenant_id: str) -> Tenant:
-    """Helper function to get or create tenant"""
-    tenant = db.query(Tenant).filter(Tenant.id == tenant_id).first()
-    if not tenant:
-        tenant = Tenant(id=tenant_id, name=tenant_id.replace("_", " ").title())
-        db.add(tenant)
-        db.commit()
-        db.refresh(tenant)
-    return tenant
+# Student identity columns in an uploaded gradebook; every other column is an assignment
+STUDENT_COLUMNS = ["Last Name", "First Name", "Email"]
 
+# Default max points for assignments first seen in an upload
+DEFAULT_MAX_POINTS = 100.0
 
-def get_or_create_teacher(db: Session, teacher_name: str, tenant_id: str) -> Teacher:
-    """Helper function to get or create teacher"""
-    teacher = db.query(Teacher).filter(
-        Teacher.name == teacher_name,
-        Teacher.tenant_id == tenant_id
-    ).first()
+# Bytes of CSV parsed per block when streaming an upload
+UPLOAD_BLOCK_SIZE = 4 << 20
+
+# Eager-load options for the single-student grade views. Everything is
+# JOINed, so a student with all their grades, assignments, teachers and
+# tags comes back in one query; rows only multiply within one student.
+STUDENT_GRADES_OPTIONS = joinedload(Student.grades).options(
+    joinedload(Grade.assignment).joinedload(Assignment.tags),
+    joinedload(Grade.teacher)
+)
+
+
+# Tenants are never deleted, so once one is known to exist this process
+# can skip the lookup on every later request
+_known_tenants = set()
+
+
+def ensure_tenant(db: Session, tenant_id: str) -> None:
+    """Helper function to create the tenant on first contact"""
+    if tenant_id in _known_tenants:
+        return
+    
+    stmt = lambda_stmt(lambda: select(exists().where(Tenant.id == tenant_id)))
+    if db.execute(stmt).scalar():
+        _known_tenants.add(tenant_id)
+    else:
+        # The caller commits the new tenant with the rest of its work; it is
+        # only remembered once a later request finds it committed. Another
+        # request creating the same tenant meanwhile is not an error.
+        db.execute(
+            pg_insert(Tenant)
+            .values(id=tenant_id, name=tenant_id.replace("_", " ").title())
+            .on_conflict_do_nothing(index_elements=["id"])
+        )
+
+
+# Teachers are never deleted either, so committed teacher ids are cached by
+# (name, tenant) and repeat uploads skip the lookup
+_teacher_ids = {}
+
+
+def get_or_create_teacher_id(db: Session, teacher_name: str, tenant_id: str) -> int:
+    """Helper function to get or create teacher, returning its id"""
+    key = (teacher_name, tenant_id)
+    if key in _teacher_ids:
+        return _teacher_ids[key]
     
-    if not teacher:
+    stmt = lambda_stmt(
+        lambda: select(Teacher.id).where(Teacher.name == teacher_name, Teacher.tenant_id == tenant_id)
+    )
+    teacher_id = db.execute(stmt).scalars().first()
+    
+    if teacher_id is None:
         teacher = Teacher(name=teacher_name, tenant_id=tenant_id)
         db.add(teacher)
-        db.commit()
-        db.refresh(teacher)
+        db.flush()  # assigns the id; the caller commits with the rest of its work
+        return teacher.id
+    
+    _teacher_ids[key] = teacher_id
+    return teacher_id
+
+
+def insert_missing_ids(db: Session, model, key: str, rows: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Insert rows of a model that is unique on (tenant_id, key), skipping rows
+    that already exist, and return the id of every row by its key. RETURNING
+    omits rows a concurrent upload inserted first, so those are selected
+    afterwards.
+    """
+    column = getattr(model, key)
+    stmt = (pg_insert(model)
+            .on_conflict_do_nothing(index_elements=["tenant_id", key])
+            .returning(model.id, column))
+    ids = {value: row_id for row_id, value in db.execute(stmt, rows)}
+    
+    missing = {row[key] for row in rows} - ids.keys()
+    if missing:
+        ids.update({
+            value: row_id
+            for row_id, value in db.query(model.id, column).filter(
+                model.tenant_id == rows[0]["tenant_id"],
+                column.in_(missing)
+            )
+        })
+    return ids
+
+
+def check_upload_size(file: UploadFile) -> None:
+    """
+    Reject an uploaded file over MAX_FILE_SIZE before it is parsed or read
+    into memory. Covers chunked requests that carry no Content-Length.
+    """
+    if file.size is not None and file.size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File size exceeds {MAX_FILE_SIZE // (1024 * 1024)}MB limit"
+        )
+
+
+# Leading bytes of file types commonly uploaded by mistake in place of a CSV
+_BINARY_SIGNATURES = (
+    b"%PDF",              # PDF
+    b"PK\x03\x04",        # zip containers, including .xlsx
+    b"\xd0\xcf\x11\xe0",  # legacy Office documents, including .xls
+)
+
+
+def check_csv_signature(file: UploadFile) -> None:
+    """Reject binary uploads from their first bytes, before anything is decoded or parsed"""
+    head = file.file.read(8192)
+    file.file.seek(0)
+    if head.startswith(_BINARY_SIGNATURES) or b"\x00" in head:
+        raise HTTPException(status_code=400, detail="File does not appear to be a CSV")
+
+
+def decode_csv(content: bytes) -> str:
+    """Decode an uploaded CSV read into memory, dropping any byte order mark"""
+    try:
+        return content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV file must be UTF-8 encoded")
+
+
+def read_upload_columns(file: UploadFile) -> List[str]:
+    """
+    Read and validate the header of an uploaded gradebook, leaving the file
+    rewound for parsing. Every column is typed up front from this header:
+    Arrow infers types from the first block only, so a later block with a
+    non-numeric score would otherwise fail the whole parse.
+    """
+    check_csv_signature(file)
+    try:
+        columns = next(csv.reader([file.file.readline(65536).decode("utf-8-sig")]), [])
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV file must be UTF-8 encoded")
+    file.file.seek(0)
+    
+    # Validate required columns
+    required_columns = set(STUDENT_COLUMNS)
+    if not required_columns.issubset(set(columns)):
+        missing = required_columns - set(columns)
+        raise HTTPException(status_code=400, detail=f"Missing required columns: {missing}")
+    
+    # A trailing comma in the header would otherwise create a nameless assignment
+    if any(not col.strip() for col in columns):
+        raise HTTPException(status_code=400, detail="Column names must not be blank")
+    
+    # Column names key the assignment lookups and the melt, so each must be unique
+    duplicates = sorted({col for col in columns if columns.count(col) > 1})
+    if duplicates:
+        raise HTTPException(status_code=400, detail=f"Duplicate columns: {duplicates}")
+    
+    # Every other column is an assignment
+    if len(columns) == len(STUDENT_COLUMNS):
+        raise HTTPException(status_code=400, detail="No assignment columns found")
     
-    return teacher
+    return columns
+
+
+def pad_csv_row(text: str, width: int) -> List[Optional[str]]:
+    """Parse one short CSV row and pad it with nulls to the header's width"""
+    cells = next(csv.reader([text]), [])
+    return [cell or None for cell in cells] + [None] * (width - len(cells))
 
 
 @app.get("/", response_class=HTMLResponse)
-async def dashboard(request: Request, db: Session = Depends(get_db)):
+def dashboard(request: Request, db: Session = Depends(get_db)):
     tenant_id = get_tenant_from_host(request.headers.get("host"))
-    tenant = get_or_create_tenant(db, tenant_id)
+    ensure_tenant(db, tenant_id)
+    db.commit()
     
-    # Use StudentService to get students
-    student_service = StudentService(db)
-    students = student_service.get_students_by_tenant(tenant_id)
-
+    # The page fetches its students and grades from the JSON APIs, so the
+    # template itself needs no rows
     return templates.TemplateResponse(
         "dashboard.html",
-        {"request": request, "students": students, "tenant": tenant_id}
+        {"request": request, "tenant": tenant_id}
     )
 
 
@@ -86,7 +286,7 @@ async def upload_page(request: Request):
 
 
 @app.post("/upload")
-async def upload_csv(
+def upload_csv(
     request: Request,
     file: UploadFile = File(...),
     teacher_name: str = Form(...),
@@ -94,155 +294,225 @@ async def upload_csv(
     db: Session = Depends(get_db)
 ):
     tenant_id = get_tenant_from_host(request.headers.get("host"))
-    tenant = get_or_create_tenant(db, tenant_id)
-    teacher = get_or_create_teacher(db, teacher_name, tenant_id)
+    
+    # Reject an oversized file or a bad header before any database work
+    check_upload_size(file)
+    columns = read_upload_columns(file)
+    assignment_columns = [col for col in columns if col not in STUDENT_COLUMNS]
+    
+    ensure_tenant(db, tenant_id)
+    teacher_id = get_or_create_teacher_id(db, teacher_name, tenant_id)
     
     try:
-        # Read CSV content
-        content = await file.read()
-        csv_content = content.decode('utf-8')
-        
-        # Initialize services
-        csv_processor = CSVProcessor(db)
-        student_service = StudentService(db)
-        assignment_service = AssignmentService(db)
-        
-        # Process CSV using pandas for the existing format
-        df = pd.read_csv(io.StringIO(csv_content))
+        # Resolve existing assignments in one query, insert the rest in one statement
+        assignment_ids = {
+            name: assignment_id
+            for assignment_id, name in db.query(Assignment.id, Assignment.name).filter(
+                Assignment.tenant_id == tenant_id,
+                Assignment.name.in_(assignment_columns)
+            )
+        }
+        new_assignments = [
+            {"name": name, "max_points": DEFAULT_MAX_POINTS, "tenant_id": tenant_id}
+            for name in assignment_columns
+            if name not in assignment_ids
+        ]
+        if new_assignments:
+            assignment_ids.update(insert_missing_ids(db, Assignment, "name", new_assignments))
         
-        # Validate required columns
-        required_columns = {"Last Name", "First Name", "Email"}
-        if not required_columns.issubset(set(df.columns)):
-            missing = required_columns - set(df.columns)
-            raise HTTPException(status_code=400, detail=f"Missing required columns: {missing}")
+        # Tag the uploaded assignments with the comma-separated class tags,
+        # resolving all tag names in one query
+        tag_names = list(dict.fromkeys(name.strip() for name in class_tag.split(",") if name.strip()))
+        if tag_names:
+            tag_ids = {
+                name: tag_id
+                for tag_id, name in db.query(Tag.id, Tag.name).filter(
+                    Tag.tenant_id == tenant_id,
+                    Tag.name.in_(tag_names)
+                )
+            }
+            new_tags = [{"name": name, "tenant_id": tenant_id} for name in tag_names if name not in tag_ids]
+            if new_tags:
+                tag_ids.update(insert_missing_ids(db, Tag, "name", new_tags))
+            
+            tag_links = [
+                {"assignment_id": assignment_id, "tag_id": tag_id}
+                for assignment_id in assignment_ids.values()
+                for tag_id in tag_ids.values()
+            ]
+            db.execute(pg_insert(assignment_tags).on_conflict_do_nothing(), tag_links)
         
-        # Determine assignment columns (exclude student info columns)
-        assignment_columns = [col for col in df.columns if col not in ("Last Name", "First Name", "Email")]
+        # Rows whose cell count doesn't match the header are set aside instead
+        # of failing the parse. Excel drops trailing empty cells, so short
+        # rows are padded with blanks and processed after the file; rows with
+        # extra cells are skipped.
+        short_rows = []
+        long_rows = []
         
-        if not assignment_columns:
-            raise HTTPException(status_code=400, detail="No assignment columns found")
+        def set_aside(row):
+            (short_rows if row.actual_columns < row.expected_columns else long_rows).append(row.text)
+            return "skip"
         
-        # Default max points
-        DEFAULT_MAX_POINTS = 100.0
+        # Stream the spooled upload file through Arrow's multithreaded reader
+        # one block at a time, so memory stays bounded by the block size
+        # rather than the file size. Empty cells become nulls, as with pandas.
+        reader = pacsv.open_csv(
+            file.file,
+            read_options=pacsv.ReadOptions(use_threads=True, block_size=UPLOAD_BLOCK_SIZE),
+            parse_options=pacsv.ParseOptions(invalid_row_handler=set_aside),
+            convert_options=pacsv.ConvertOptions(
+                column_types={col: pa.string() for col in columns},
+                strings_can_be_null=True
+            )
+        )
         
-        # Create or get assignments using AssignmentService
-        assignments_cache = {}
-        for col in assignment_columns:
-            assignment = assignment_service.get_assignment_by_name_and_tenant(col, tenant_id)
-            if not assignment:
-                assignment = assignment_service.create_assignment(
-                    name=col,
-                    max_points=DEFAULT_MAX_POINTS,
-                    tenant_id=tenant_id
-                )
-            assignments_cache[col] = assignment
+        def blocks():
+            for batch in reader:
+                yield batch.to_pandas()
+            if short_rows:
+                yield pd.DataFrame([pad_csv_row(text, len(columns)) for text in short_rows], columns=columns)
         
-        # Process each student row
+        student_ids = {}
         processed_students = 0
         processed_grades = 0
-        
-        for _, row in df.iterrows():
-            first_name = row["First Name"]
-            last_name = row["Last Name"]
-            email = row["Email"]
+        skipped_rows = 0
+        for df in blocks():
+            df["Email"] = df["Email"].str.strip().str.lower()
+            df["First Name"] = df["First Name"].str.strip()
+            df["Last Name"] = df["Last Name"].str.strip()
             
-            # Get or create student using StudentService
-            student = student_service.get_student_by_email_and_tenant(email, tenant_id)
-            if not student:
-                student = student_service.create_student(
-                    first_name=first_name,
-                    last_name=last_name,
-                    email=email,
-                    tenant_id=tenant_id
+            # Skip rows that can't form a student, checking whole columns at
+            # once: a missing or malformed email, or a blank name
+            valid = (df["Email"].str.match(EMAIL_RE, na=False)
+                     & df["First Name"].str.len().gt(0)
+                     & df["Last Name"].str.len().gt(0))
+            
+            # Full syntax check, once per distinct address that passed the cheap one
+            checked = {email for email in df.loc[valid, "Email"].unique() if validate_email(email)}
+            valid &= df["Email"].isin(checked)
+            skipped_rows += int((~valid).sum())
+            df = df[valid]
+            
+            # Reshape to one row per (student, assignment) score. Non-numeric
+            # cells (e.g. "Excused") coerce to NaN and are skipped with the blanks.
+            long_df = df.melt(
+                id_vars=STUDENT_COLUMNS,
+                value_vars=assignment_columns,
+                var_name="assignment",
+                value_name="score"
+            )
+            long_df["score"] = pd.to_numeric(long_df["score"], errors="coerce")
+            long_df = long_df.dropna(subset=["score"])
+            
+            # Resolve students not seen in an earlier block in one query,
+            # insert the rest in one statement
+            students_df = df.drop_duplicates(subset="Email", keep="last")
+            students_df = students_df[~students_df["Email"].isin(student_ids.keys())]
+            student_ids.update({
+                email: student_id
+                for student_id, email in db.query(Student.id, Student.email).filter(
+                    Student.tenant_id == tenant_id,
+                    Student.email.in_(students_df["Email"].tolist())
                 )
-                processed_students += 1
+            })
+            new_students = [
+                {"first_name": first_name, "last_name": last_name, "email": email, "tenant_id": tenant_id}
+                for last_name, first_name, email in students_df[STUDENT_COLUMNS].itertuples(index=False, name=None)
+                if email not in student_ids
+            ]
+            if new_students:
+                student_ids.update(insert_missing_ids(db, Student, "email", new_students))
+                processed_students += len(new_students)
+            
+            # Upsert the block's grades with one executemany; a key may only appear once
+            long_df["student_id"] = long_df["Email"].map(student_ids)
+            long_df["assignment_id"] = long_df["assignment"].map(assignment_ids)
+            long_df = long_df.drop_duplicates(subset=["student_id", "assignment_id"], keep="last")
             
-            # Process grades for each assignment column
-            for assignment_name in assignment_columns:
-                score_value = row[assignment_name]
-                if pd.isna(score_value):
-                    continue  # skip if no grade
-                
-                assignment = assignments_cache[assignment_name]
-                
-                # Check if grade already exists
-                existing_grade = db.query(Grade).filter(
-                    Grade.student_id == student.id,
-                    Grade.assignment_id == assignment.id,
-                    Grade.tenant_id == tenant_id
-                ).first()
-                
-                if existing_grade:
-                    # Update existing grade
-                    existing_grade.score = float(score_value)
-                    existing_grade.teacher_id = teacher.id
-                    existing_grade.class_tag = class_tag
-                else:
-                    # Create new grade
-                    grade = Grade(
-                        student_id=student.id,
-                        teacher_id=teacher.id,
-                        assignment_id=assignment.id,
-                        tenant_id=tenant_id,
-                        score=float(score_value),
-                        class_tag=class_tag
-                    )
-                    db.add(grade)
-                    processed_grades += 1
+            grade_values = long_df[["student_id", "assignment_id", "score"]].itertuples(index=False, name=None)
+            grade_rows = [
+                {
+                    "student_id": int(student_id),
+                    "assignment_id": int(assignment_id),
+                    "tenant_id": tenant_id,
+                    "teacher_id": teacher_id,
+                    "score": float(score),
+                    "class_tag": class_tag
+                }
+                for student_id, assignment_id, score in grade_values
+            ]
+            if grade_rows:
+                stmt = pg_insert(Grade)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["student_id", "assignment_id", "tenant_id"],
+                    set_={
+                        "score": stmt.excluded.score,
+                        "teacher_id": stmt.excluded.teacher_id,
+                        "class_tag": stmt.excluded.class_tag,
+                        "updated_at": UTC_NOW
+                    }
+                )
+                db.execute(stmt, grade_rows)
+                processed_grades += len(grade_rows)
         
+        StudentService(db).bump_data_version_by_tenant(tenant_id)
+        skipped_rows += len(long_rows)
         db.commit()
         
         return {
             "message": "CSV uploaded successfully",
             "processed_students": processed_students,
             "processed_grades": processed_grades,
-            "assignments_processed": len(assignment_columns)
+            "assignments_processed": len(assignment_columns),
+            "skipped_rows": skipped_rows
         }
         
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error processing CSV: {str(e)}")
+    except (pa.ArrowInvalid, UnicodeDecodeError):
+        # Database errors propagate to the SQLAlchemyError handler; the
+        # session rolls back when get_db closes it
+        raise HTTPException(status_code=400, detail="Could not parse CSV file")
+
+
+# Latest grades table JSON per tenant, as (data version, payload), for the
+# most recently used tenants. A newer version replaces a tenant's entry and
+# the least recently used tenant is dropped once the cache is full.
+GRADES_TABLE_CACHE_TENANTS = int(os.getenv("GRADES_TABLE_CACHE_TENANTS", "16"))
+_grades_tables: "OrderedDict[str, tuple]" = OrderedDict()
+_grades_tables_lock = threading.Lock()
 
 
 @app.get("/api/grades-table")
-async def get_grades_table(request: Request, db: Session = Depends(get_db)):
+def get_grades_table(request: Request, db: Session = Depends(get_db)):
     tenant_id = get_tenant_from_host(request.headers.get("host"))
     
-    # Use StudentService to get students with grades
+    # The table is only rebuilt after the tenant's data version changes
     student_service = StudentService(db)
-    students = student_service.get_students_by_tenant(tenant_id)
+    version = student_service.get_data_version_by_tenant(tenant_id)
     
-    students_data = []
-    for student in students:
-        grade_summary = student_service.get_student_grade_summary_by_tenant(student.email, tenant_id)
-        
-        grades_data = []
-        for assignment_data in grade_summary.get("assignments", []):
-            grades_data.append({
-                "assignment": assignment_data["assignment_name"],
-                "date": assignment_data["assignment_date"].isoformat() if assignment_data["assignment_date"] else None,
-                "score": assignment_data["score"],
-                "max_points": assignment_data["max_points"],
-                "tags": []  # Add class tags if needed
-            })
-        
-        students_data.append({
-            "id": student.id,
-            "first_name": student.first_name,
-            "last_name": student.last_name,
-            "email": student.email,
-            "grades": grades_data
-        })
+    with _grades_tables_lock:
+        cached = _grades_tables.get(tenant_id)
+        if cached is not None:
+            _grades_tables.move_to_end(tenant_id)
     
-    return {"students": students_data}
+    if cached is None or cached[0] != version:
+        cached = (version, student_service.get_grades_table_json_by_tenant(tenant_id).encode("utf-8"))
+        # A tenant without a row has no data; don't let unknown hosts fill the cache
+        if version is not None:
+            with _grades_tables_lock:
+                _grades_tables[tenant_id] = cached
+                _grades_tables.move_to_end(tenant_id)
+                while len(_grades_tables) > GRADES_TABLE_CACHE_TENANTS:
+                    _grades_tables.popitem(last=False)
+    
+    return Response(content=cached[1], media_type="application/json")
 
 
 @app.get("/api/student/{student_id}/grades")
-async def get_student_grades(student_id: int, request: Request, db: Session = Depends(get_db)):
+def get_student_grades(student_id: int, request: Request, db: Session = Depends(get_db)):
     tenant_id = get_tenant_from_host(request.headers.get("host"))
     
     # Get student and verify tenant
-    student = db.query(Student).filter(
+    student = db.query(Student).options(STUDENT_GRADES_OPTIONS).filter(
         Student.id == student_id,
         Student.tenant_id == tenant_id
     ).first()
@@ -250,110 +520,120 @@ async def get_student_grades(student_id: int, request: Request, db: Session = De
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     
-    # Use StudentService to get grade summary
-    student_service = StudentService(db)
-    grade_summary = student_service.get_student_grade_summary_by_tenant(student.email, tenant_id)
+    assignments = []
+    for grade in student.grades:
+        assignment = grade.assignment
+        assignments.append({
+            "assignment_name": assignment.name,
+            "assignment_date": assignment.date,
+            "max_points": assignment.max_points,
+            "score": grade.score,
+            "percentage": (grade.score / assignment.max_points * 100) if grade.score and assignment.max_points > 0 else 0,
+            "teacher": grade.teacher.name,
+            "tags": [tag.name for tag in assignment.tags]
+        })
     
-    return grade_summary.get("assignments", [])
+    return assignments
 
 
 @app.get("/api/student/{email}")
-async def get_student_by_email(email: str, request: Request, db: Session = Depends(get_db)):
+def get_student_by_email(email: str, request: Request, db: Session = Depends(get_db)):
     tenant_id = get_tenant_from_host(request.headers.get("host"))
     
-    # Use StudentService
-    student_service = StudentService(db)
-    student = student_service.get_student_by_email_and_tenant(email, tenant_id)
+    # Load the student with grades, assignments and tags in one query so
+    # the loop below never triggers a lazy load
+    student = db.query(Student).options(STUDENT_GRADES_OPTIONS).filter(
+        Student.email == email.strip().lower(),
+        Student.tenant_id == tenant_id
+    ).first()
     
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     
-    # Get comprehensive grade summary
-    grade_summary = student_service.get_student_grade_summary_by_tenant(email, tenant_id)
+    grades = []
+    for grade in student.grades:
+        assignment = grade.assignment
+        grades.append({
+            "assignment": assignment.name,
+            "date": assignment.date,
+            "score": grade.score,
+            "max_points": assignment.max_points,
+            "teacher": grade.teacher.name,
+            "tags": [tag.name for tag in assignment.tags]
+        })
+    
+    total_points = sum(grade["score"] or 0 for grade in grades)
+    max_possible = sum(grade["max_points"] for grade in grades)
+    overall_percentage = (total_points / max_possible * 100) if max_possible > 0 else 0
     
     return {
         "id": student.id,
         "first_name": student.first_name,
         "last_name": student.last_name,
         "email": student.email,
-        "grades": grade_summary.get("assignments", []),
-        "total_assignments": grade_summary.get("grade_count", 0),
-        "total_points": grade_summary.get("earned_points", 0),
-        "max_possible": grade_summary.get("total_points", 0),
-        "overall_percentage": grade_summary.get("percentage", 0)
+        "grades": grades,
+        "total_assignments": len(grades),
+        "total_points": total_points,
+        "max_possible": max_possible,
+        "overall_percentage": round(overall_percentage, 2)
     }
 
 
+# Sample gradebook served by /api/downloadTemplate. It never changes, so
+# it is kept as ready-to-send bytes.
+TEMPLATE_CSV_BYTES = (
+    "Last Name,First Name,Email,Assignment 1,Assignment 2,Quiz 1\n"
+    "Smith,John,john.smith@example.com,85,88,90\n"
+    "Johnson,Jane,jane.johnson@example.com,92,95,88\n"
+    "Williams,Bob,bob.williams@example.com,78,82,85\n"
+).encode("utf-8")
+
+
+TEMPLATE_HEADERS = {
+    "Cache-Control": "public, max-age=86400",
+    "ETag": f'"{hashlib.sha256(TEMPLATE_CSV_BYTES).hexdigest()[:16]}"'
+}
+
+
 @app.get("/api/downloadTemplate")
-async def download_template():
-    """Generate a CSV template for grade uploads"""
-    template_data = {
-        "Last Name": ["Smith", "Johnson", "Williams"],
-        "First Name": ["John", "Jane", "Bob"],
-        "Email": ["john.smith@example.com", "jane.johnson@example.com", "bob.williams@example.com"],
-        "Assignment 1": [85, 92, 78],
-        "Assignment 2": [88, 95, 82],
-        "Quiz 1": [90, 88, 85]
-    }
-    
-    df = pd.DataFrame(template_data)
-    csv_content = df.to_csv(index=False)
+async def download_template(request: Request):
+    """Serve the CSV template for grade uploads"""
+    # Clients holding the current template get an empty 304
+    if request.headers.get("if-none-match") == TEMPLATE_HEADERS["ETag"]:
+        return Response(status_code=304, headers=TEMPLATE_HEADERS)
     
     return Response(
-        content=csv_content,
+        content=TEMPLATE_CSV_BYTES,
         media_type="text/csv",
         headers={
-            "Content-Disposition": "attachment; filename=grade_template.csv"
+            "Content-Disposition": "attachment; filename=grade_template.csv",
+            **TEMPLATE_HEADERS
         }
     )
 
 
 @app.get("/api/dashboard/stats")
-async def get_dashboard_stats(request: Request, db: Session = Depends(get_db)):
+def get_dashboard_stats(request: Request, db: Session = Depends(get_db)):
     tenant_id = get_tenant_from_host(request.headers.get("host"))
     
-    # Use services to get statistics
-    student_service = StudentService(db)
-    assignment_service = AssignmentService(db)
-    
-    total_students = student_service.get_student_count_by_tenant(tenant_id)
-    total_assignments = assignment_service.get_assignment_count_by_tenant(tenant_id)
-    total_grades = db.query(Grade).filter(Grade.tenant_id == tenant_id).count()
-    
-    # Get class statistics
-    class_stats = student_service.get_class_statistics_by_tenant(tenant_id)
-    
-    return {
-        "total_students": total_students,
-        "total_assignments": total_assignments,
-        "total_grades": total_grades,
-        "average_class_percentage": class_stats.get("average_class_percentage", 0)
-    }
+    return StudentService(db).get_dashboard_stats_by_tenant(tenant_id)
 
 
 # Additional endpoints using the services
 
 @app.get("/api/assignments")
-async def get_assignments(request: Request, db: Session = Depends(get_db)):
+def get_assignments(request: Request, db: Session = Depends(get_db)):
     """Get all assignments for the tenant"""
     tenant_id = get_tenant_from_host(request.headers.get("host"))
     
     assignment_service = AssignmentService(db)
     assignments = assignment_service.get_assignments_by_tenant(tenant_id)
     
-    return {"assignments": [
-        {
-            "id": assignment.id,
-            "name": assignment.name,
-            "max_points": assignment.max_points,
-            "date": assignment.date.isoformat() if assignment.date else None
-        }
-        for assignment in assignments
-    ]}
+    return {"assignments": [assignment._asdict() for assignment in assignments]}
 
 
 @app.get("/api/assignments/{assignment_id}/statistics")
-async def get_assignment_statistics(assignment_id: int, request: Request, db: Session = Depends(get_db)):
+def get_assignment_statistics(assignment_id: int, request: Request, db: Session = Depends(get_db)):
     """Get statistics for a specific assignment"""
     tenant_id = get_tenant_from_host(request.headers.get("host"))
     
@@ -375,11 +655,15 @@ async def validate_csv_format(
     db: Session = Depends(get_db)
 ):
     """Validate CSV format before processing"""
+    # The upload is read on the event loop; parsing and database work run in
+    # the threadpool so they don't block other requests
+    check_upload_size(file)
+    check_csv_signature(file)
     content = await file.read()
-    csv_content = content.decode('utf-8')
+    csv_content = decode_csv(content)
     
     csv_processor = CSVProcessor(db)
-    validation_result = csv_processor.validate_csv_format(csv_content, csv_type)
+    validation_result = await run_in_threadpool(csv_processor.validate_csv_format, csv_content, csv_type)
     
     return validation_result
 
@@ -393,12 +677,16 @@ async def process_students_csv(
     """Process CSV file containing student information"""
     tenant_id = get_tenant_from_host(request.headers.get("host"))
     
+    check_upload_size(file)
+    check_csv_signature(file)
     content = await file.read()
-    csv_content = content.decode('utf-8')
+    csv_content = decode_csv(content)
+    
+    # The tenant is committed together with the imported students
+    await run_in_threadpool(ensure_tenant, db, tenant_id)
     
     csv_processor = CSVProcessor(db)
-    # Note: You'll need to modify CSVProcessor to handle tenant_id
-    result = csv_processor.process_students_csv_with_tenant(csv_content, tenant_id)
+    result = await run_in_threadpool(csv_processor.process_students_csv_with_tenant, csv_content, tenant_id)
     
     return result
 
@@ -412,27 +700,29 @@ async def process_assignments_csv(
     """Process CSV file containing assignment information"""
     tenant_id = get_tenant_from_host(request.headers.get("host"))
     
+    check_upload_size(file)
+    check_csv_signature(file)
     content = await file.read()
-    csv_content = content.decode('utf-8')
+    csv_content = decode_csv(content)
+    
+    # The tenant is committed together with the imported assignments
+    await run_in_threadpool(ensure_tenant, db, tenant_id)
     
     csv_processor = CSVProcessor(db)
-    # Note: You'll need to modify CSVProcessor to handle tenant_id
-    result = csv_processor.process_assignments_csv_with_tenant(csv_content, tenant_id)
+    result = await run_in_threadpool(csv_processor.process_assignments_csv_with_tenant, csv_content, tenant_id)
     
     return result
 
 
 @app.get("/api/export/students")
-async def export_students_csv(request: Request, db: Session = Depends(get_db)):
+def export_students_csv(request: Request, db: Session = Depends(get_db)):
     """Export students to CSV"""
     tenant_id = get_tenant_from_host(request.headers.get("host"))
     
     csv_processor = CSVProcessor(db)
-    # Note: You'll need to modify CSVProcessor to handle tenant_id
-    csv_content = csv_processor.export_students_csv_by_tenant(tenant_id)
     
-    return Response(
-        content=csv_content,
+    return StreamingResponse(
+        csv_processor.iter_students_csv_by_tenant(tenant_id),
         media_type="text/csv",
         headers={
             "Content-Disposition": "attachment; filename=students_export.csv"
@@ -441,16 +731,14 @@ async def export_students_csv(request: Request, db: Session = Depends(get_db)):
 
 
 @app.get("/api/export/assignments")
-async def export_assignments_csv(request: Request, db: Session = Depends(get_db)):
+def export_assignments_csv(request: Request, db: Session = Depends(get_db)):
     """Export assignments to CSV"""
     tenant_id = get_tenant_from_host(request.headers.get("host"))
     
     csv_processor = CSVProcessor(db)
-    # Note: You'll need to modify CSVProcessor to handle tenant_id
-    csv_content = csv_processor.export_assignments_csv_by_tenant(tenant_id)
     
-    return Response(
-        content=csv_content,
+    return StreamingResponse(
+        csv_processor.iter_assignments_csv_by_tenant(tenant_id),
         media_type="text/csv",
         headers={
             "Content-Disposition": "attachment; filename=assignments_export.csv"
@@ -459,7 +747,7 @@ async def export_assignments_csv(request: Request, db: Session = Depends(get_db)
 
 
 @app.get("/api/export/grades")
-async def export_grades_csv(
+def export_grades_csv(
     request: Request,
     assignment_id: Optional[int] = None,
     db: Session = Depends(get_db)
@@ -468,11 +756,9 @@ async def export_grades_csv(
     tenant_id = get_tenant_from_host(request.headers.get("host"))
     
     csv_processor = CSVProcessor(db)
-    # Note: You'll need to modify CSVProcessor to handle tenant_id
-    csv_content = csv_processor.export_grades_csv_by_tenant(tenant_id, assignment_id)
     
-    return Response(
-        content=csv_content,
+    return StreamingResponse(
+        csv_processor.iter_grades_csv_by_tenant(tenant_id, assignment_id),
         media_type="text/csv",
         headers={
             "Content-Disposition": f"attachment; filename=grades_export_{assignment_id or 'all'}.csv"
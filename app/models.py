@@ -2,10 +2,13 @@ from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Tex
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import Index, UniqueConstraint, func
 
 Base = declarative_base()
 
+# Current UTC time stamped by the database, so bulk writes don't need a Python value per row
+UTC_NOW = func.timezone("UTC", func.now())
+
 # Many-to-many relationship table for assignments and tags
 assignment_tags = Table(
     'assignment_tags',
@@ -23,6 +26,12 @@ class Tag(Base):
     
     # Many-to-many relationship with assignments
     assignments = relationship("Assignment", secondary=assignment_tags, back_populates="tags")
+
+    # Composite unique constraint on tenant_id + name, backing tag lookups by name
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "name", name="uq_tag_tenant_name"),
+        {"schema": None},
+    )
     
     def __repr__(self):
         return f"<Tag(name='{self.name}')>"
@@ -32,8 +41,9 @@ class Tenant(Base):
     
     id = Column(String, primary_key=True)  # subdomain-based tenant ID
     name = Column(String, nullable=False)
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")  # bumped on every data write
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, server_default=UTC_NOW, onupdate=UTC_NOW)
     
     # Relationships
     students = relationship("Student", back_populates="tenant")
@@ -51,15 +61,16 @@ class Student(Base):
     email = Column(String, nullable=False)
     tenant_id = Column(String, ForeignKey("tenants.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, server_default=UTC_NOW, onupdate=UTC_NOW)
     
     # Relationships
     tenant = relationship("Tenant", back_populates="students")
     grades = relationship("Grade", back_populates="student")
 
-    # Composite unique constraint on email + tenant_id
+    # Composite unique constraint on tenant_id + email; tenant first so it also
+    # serves the per-tenant student listings and counts
     __table_args__ = (
-        UniqueConstraint("email", "tenant_id", name="uq_student_email_tenant"),
+        UniqueConstraint("tenant_id", "email", name="uq_student_tenant_email"),
         {"schema": None},
     )
 
@@ -72,12 +83,18 @@ class Teacher(Base):
     tenant_id = Column(String, ForeignKey("tenants.id"), nullable=False)
     email = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, server_default=UTC_NOW, onupdate=UTC_NOW)
     
     # Relationships
     tenant = relationship("Tenant", back_populates="teachers")
     grades = relationship("Grade", back_populates="teacher")
 
+    # Teachers are looked up by name within a tenant on every upload
+    __table_args__ = (
+        Index("ix_teacher_tenant_name", "tenant_id", "name"),
+        {"schema": None},
+    )
+
 
 class Assignment(Base):
     __tablename__ = "assignments"
@@ -89,13 +106,20 @@ class Assignment(Base):
     date = Column(DateTime, nullable=True)  # Assignment due date or creation date
     description = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, server_default=UTC_NOW, onupdate=UTC_NOW)
     
     # Relationships
     tenant = relationship("Tenant", back_populates="assignments")
     grades = relationship("Grade", back_populates="assignment")
     tags = relationship("Tag", secondary=assignment_tags, back_populates="assignments")
 
+    # Composite unique constraint on tenant_id + name; tenant first so it also
+    # serves the per-tenant assignment listings and counts
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "name", name="uq_assignment_tenant_name"),
+        {"schema": None},
+    )
+
 
 class Grade(Base):
     __tablename__ = "grades"
@@ -109,7 +133,7 @@ class Grade(Base):
     class_tag = Column(String, nullable=True)  # For organizing by class/section
     comments = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, server_default=UTC_NOW, onupdate=UTC_NOW)
 
     # Relationships
     student = relationship("Student", back_populates="grades")
@@ -125,5 +149,7 @@ class Grade(Base):
             "tenant_id",
             name="uq_student_assignment_tenant"
         ),
+        # Per-tenant grade scans (counts, exports) and per-assignment stats
+        Index("ix_grade_tenant_assignment", "tenant_id", "assignment_id"),
         {"schema": None},
     )
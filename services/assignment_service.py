@@ -3,9 +3,9 @@
 from typing import List, Optional, Dict, Any
 from datetime import date
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import Row, func, desc, select
 
-from app.database import get_db
+from app.database import SessionLocal
 from app.models import Assignment, Grade, Student
 
 
@@ -13,7 +13,7 @@ class AssignmentService:
     """Service for managing assignment operations"""
     
     def __init__(self, db: Session = None):
-        self.db = db or next(get_db())
+        self.db = db or SessionLocal()
     
     def create_assignment(self, name: str, max_points: float, 
                          assignment_date: Optional[date] = None) -> Assignment:
@@ -36,6 +36,17 @@ class AssignmentService:
         """Get assignment by name"""
         return self.db.query(Assignment).filter(Assignment.name == name).first()
     
+    def get_assignments_by_tenant(self, tenant_id: str) -> List[Row]:
+        """
+        Get a tenant's assignments, newest first, as lightweight rows of
+        id, name, max_points and date rather than full ORM objects
+        """
+        return self.db.execute(
+            select(Assignment.id, Assignment.name, Assignment.max_points, Assignment.date)
+            .where(Assignment.tenant_id == tenant_id)
+            .order_by(Assignment.date.desc())
+        ).all()
+    
     def get_all_assignments(self) -> List[Assignment]:
         """Get all assignments"""
         return self.db.query(Assignment).order_by(Assignment.date.desc()).all()
@@ -2,22 +2,32 @@
 
 import csv
 import io
-from typing import List, Dict, Any, Optional, Tuple
+import logging
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from datetime import datetime, date
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 from utils.exceptions import ValidationError, ProcessingError
+from utils.validators import validate_email
 from services.student_service import StudentService
 from services.assignment_service import AssignmentService
 
-from app.database import get_db
-from app.models import Student, Assignment, Grade
+from app.database import SessionLocal
+from app.models import Student, Assignment, Grade, UTC_NOW
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per round trip when streaming exports from the database
+EXPORT_BATCH_SIZE = 1000
 
 
 class CSVProcessor:
     """Service for processing CSV files for grade management"""
     
     def __init__(self, db: Session = None):
-        self.db = db or next(get_db())
+        self.db = db or SessionLocal()
         self.student_service = StudentService(self.db)
         self.assignment_service = AssignmentService(self.db)
     
@@ -90,6 +100,93 @@ class CSVProcessor:
         except Exception as e:
             raise ProcessingError(f"Failed to process students CSV: {str(e)}")
     
+    def process_students_csv_with_tenant(self, csv_content: str, tenant_id: str) -> Dict[str, Any]:
+        """
+        Process CSV file containing student information for a tenant
+        Expected format: email, first_name, last_name
+        """
+        try:
+            csv_reader = csv.DictReader(io.StringIO(csv_content))
+            
+            # Validate headers
+            required_headers = {'email', 'first_name', 'last_name'}
+            headers = set(csv_reader.fieldnames or [])
+            
+            if not required_headers.issubset(headers):
+                missing = required_headers - headers
+                raise ValidationError(f"Missing required headers: {missing}")
+            
+            rows = []
+            errors = []
+            
+            for row_num, row in enumerate(csv_reader, start=2):
+                # Emails are stored lowercased, as the gradebook upload and lookups expect
+                email = (row['email'] or '').strip().lower()
+                first_name = (row['first_name'] or '').strip()
+                last_name = (row['last_name'] or '').strip()
+                
+                if not email or not first_name or not last_name:
+                    errors.append(f"Row {row_num}: Missing required fields")
+                    continue
+                
+                if not validate_email(email):
+                    errors.append(f"Row {row_num}: Invalid email")
+                    continue
+                
+                rows.append((email, first_name, last_name))
+            
+            # Repeated emails collapse to their last row; an upsert may touch each key once
+            students = {email: (first_name, last_name) for email, first_name, last_name in rows}
+            
+            # Find which students already exist with a single query
+            existing_emails = set(self.db.scalars(
+                select(Student.email).where(
+                    Student.tenant_id == tenant_id,
+                    Student.email.in_(students)
+                )
+            ))
+            
+            # Create or update every student with one executemany upsert
+            if students:
+                stmt = pg_insert(Student)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["tenant_id", "email"],
+                    set_={
+                        "first_name": stmt.excluded.first_name,
+                        "last_name": stmt.excluded.last_name,
+                        "updated_at": UTC_NOW
+                    }
+                )
+                self.db.execute(stmt, [
+                    {"email": email, "first_name": first_name, "last_name": last_name, "tenant_id": tenant_id}
+                    for email, (first_name, last_name) in students.items()
+                ])
+                self.student_service.bump_data_version_by_tenant(tenant_id)
+            
+            self.db.commit()
+            
+            created_students = [email for email in students if email not in existing_emails]
+            updated_students = [email for email in students if email in existing_emails]
+            
+            return {
+                "success": True,
+                "created_count": len(created_students),
+                "updated_count": len(updated_students),
+                "error_count": len(errors),
+                "errors": errors,
+                "created_students": created_students,
+                "updated_students": updated_students
+            }
+        
+        except SQLAlchemyError:
+            # Database errors reach the app's handler, which logs them and
+            # keeps their SQL text out of the response
+            self.db.rollback()
+            raise
+        except Exception as e:
+            self.db.rollback()
+            raise ProcessingError(f"Failed to process students CSV: {str(e)}")
+    
     def process_assignments_csv(self, csv_content: str) -> Dict[str, Any]:
         """
         Process CSV file containing assignment information
@@ -170,6 +267,114 @@ class CSVProcessor:
         except Exception as e:
             raise ProcessingError(f"Failed to process assignments CSV: {str(e)}")
     
+    def process_assignments_csv_with_tenant(self, csv_content: str, tenant_id: str) -> Dict[str, Any]:
+        """
+        Process CSV file containing assignment information for a tenant
+        Expected format: name, max_points, date (optional, format: YYYY-MM-DD)
+        """
+        try:
+            csv_reader = csv.DictReader(io.StringIO(csv_content))
+            
+            # Validate headers
+            required_headers = {'name', 'max_points'}
+            headers = set(csv_reader.fieldnames or [])
+            
+            if not required_headers.issubset(headers):
+                missing = required_headers - headers
+                raise ValidationError(f"Missing required headers: {missing}")
+            
+            rows = []
+            errors = []
+            
+            for row_num, row in enumerate(csv_reader, start=2):
+                name = (row['name'] or '').strip()
+                max_points_str = (row['max_points'] or '').strip()
+                date_str = (row.get('date') or '').strip()
+                
+                if not name or not max_points_str:
+                    errors.append(f"Row {row_num}: Missing required fields")
+                    continue
+                
+                try:
+                    max_points = float(max_points_str)
+                except ValueError:
+                    errors.append(f"Row {row_num}: Invalid max_points value")
+                    continue
+                
+                assignment_date = None
+                if date_str:
+                    try:
+                        assignment_date = datetime.strptime(date_str, '%Y-%m-%d')
+                    except ValueError:
+                        errors.append(f"Row {row_num}: Invalid date format (use YYYY-MM-DD)")
+                        continue
+                
+                rows.append((row_num, name, max_points, assignment_date))
+            
+            # Look up every assignment in the file with a single query
+            assignments_by_name = {
+                assignment.name: assignment
+                for assignment in self.db.query(Assignment).filter(
+                    Assignment.tenant_id == tenant_id,
+                    Assignment.name.in_({name for _, name, _, _ in rows})
+                )
+            }
+            
+            created_assignments = []
+            updated_assignments = []
+            
+            for row_num, name, max_points, assignment_date in rows:
+                assignment = assignments_by_name.get(name)
+                try:
+                    # One savepoint per row: a failing row rolls back on its own
+                    # while the rest of the file still commits together
+                    with self.db.begin_nested():
+                        if assignment:
+                            assignment.max_points = max_points
+                            assignment.date = assignment_date
+                        else:
+                            assignment = Assignment(
+                                name=name,
+                                max_points=max_points,
+                                date=assignment_date,
+                                tenant_id=tenant_id
+                            )
+                            self.db.add(assignment)
+                except SQLAlchemyError:
+                    # The database error names the statement and its parameters;
+                    # it is logged here and the client gets a fixed message
+                    logger.exception("Could not save assignment from row %d", row_num)
+                    errors.append(f"Row {row_num}: could not be saved")
+                    continue
+                
+                if name in assignments_by_name:
+                    updated_assignments.append(assignment)
+                else:
+                    assignments_by_name[name] = assignment
+                    created_assignments.append(assignment)
+            
+            self.student_service.bump_data_version_by_tenant(tenant_id)
+            self.db.commit()
+            
+            return {
+                "success": True,
+                "created_count": len(created_assignments),
+                "updated_count": len(updated_assignments),
+                "error_count": len(errors),
+                "errors": errors,
+                "created_assignments": [a.name for a in created_assignments],
+                "updated_assignments": [a.name for a in updated_assignments]
+            }
+        
+        except SQLAlchemyError:
+            # Database errors reach the app's handler, which logs them and
+            # keeps their SQL text out of the response
+            self.db.rollback()
+            raise
+        except Exception as e:
+            self.db.rollback()
+            raise ProcessingError(f"Failed to process assignments CSV: {str(e)}")
+    
     def process_grades_csv(self, csv_content: str) -> Dict[str, Any]:
         """
         Process CSV file containing grade information
@@ -326,6 +531,75 @@ class CSVProcessor:
         
         return output.getvalue()
     
+    def _iter_csv(self, header: List[str], rows) -> Iterator[str]:
+        """Yield CSV text in chunks of EXPORT_BATCH_SIZE rows"""
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(header)
+        
+        for count, row in enumerate(rows, start=1):
+            writer.writerow(row)
+            if count % EXPORT_BATCH_SIZE == 0:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+        
+        yield output.getvalue()
+    
+    def iter_students_csv_by_tenant(self, tenant_id: str) -> Iterator[str]:
+        """Export a tenant's students to CSV format, yielded in chunks from a server-side cursor"""
+        stmt = (select(Student.email, Student.first_name, Student.last_name)
+                .where(Student.tenant_id == tenant_id)
+                .order_by(Student.last_name, Student.first_name)
+                .execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE))
+        
+        return self._iter_csv(['email', 'first_name', 'last_name'], self.db.execute(stmt))
+    
+    def iter_assignments_csv_by_tenant(self, tenant_id: str) -> Iterator[str]:
+        """Export a tenant's assignments to CSV format, yielded in chunks from a server-side cursor"""
+        stmt = (select(Assignment.name, Assignment.max_points, Assignment.date)
+                .where(Assignment.tenant_id == tenant_id)
+                .order_by(Assignment.date.desc())
+                .execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE))
+        
+        rows = (
+            (name, max_points, assignment_date.strftime('%Y-%m-%d') if assignment_date else '')
+            for name, max_points, assignment_date in self.db.execute(stmt)
+        )
+        return self._iter_csv(['name', 'max_points', 'date'], rows)
+    
+    def iter_grades_csv_by_tenant(self, tenant_id: str, assignment_id: Optional[int] = None) -> Iterator[str]:
+        """
+        Export a tenant's grades to CSV format, yielded in chunks. Rows are
+        streamed from a server-side cursor in batches rather than loaded all
+        at once.
+        """
+        stmt = (select(Student.email, Student.first_name, Student.last_name,
+                       Assignment.name, Grade.score, Assignment.max_points)
+                .join(Student, Grade.student_id == Student.id)
+                .join(Assignment, Grade.assignment_id == Assignment.id)
+                .where(Grade.tenant_id == tenant_id)
+                .order_by(Student.last_name, Student.first_name, Assignment.name)
+                .execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE))
+        if assignment_id:
+            stmt = stmt.where(Grade.assignment_id == assignment_id)
+        
+        rows = (
+            (
+                email,
+                f"{first_name} {last_name}",
+                assignment_name,
+                score if score is not None else '',
+                max_points,
+                round((score / max_points * 100) if score and max_points > 0 else 0, 2)
+            )
+            for email, first_name, last_name, assignment_name, score, max_points in self.db.execute(stmt)
+        )
+        return self._iter_csv(
+            ['student_email', 'student_name', 'assignment_name', 'score', 'max_points', 'percentage'],
+            rows
+        )
+    
     def validate_csv_format(self, csv_content: str, expected_type: str) -> Dict[str, Any]:
         """Validate CSV format before processing"""
         try:
@@ -352,8 +626,9 @@ class CSVProcessor:
                     "found_headers": list(headers)
                 }
             
-            # Count rows
-            row_count = sum(1 for _ in csv_reader)
+            # Count rows on the underlying reader; DictReader would build a
+            # dict per row only to throw it away. Blank lines don't count.
+            row_count = sum(1 for row in csv_reader.reader if row)
             
             return {
                 "valid": True,
@@ -2,16 +2,57 @@
 
 from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.database import get_db
-from app.models import Student, Grade, Assignment
+from sqlalchemy import func, select, text, update
+from app.database import SessionLocal
+from app.models import Student, Grade, Assignment, Tenant
+
+
+# One document per tenant: {"students": [{..., "grades": [{...}]}]}.
+# Students without grades get an empty list; tags are aggregated per assignment.
+GRADES_TABLE_JSON_SQL = text("""
+    SELECT json_build_object(
+        'students', COALESCE(json_agg(s.student ORDER BY s.id), '[]'::json)
+    )::text
+    FROM (
+        SELECT st.id, json_build_object(
+            'id', st.id,
+            'first_name', st.first_name,
+            'last_name', st.last_name,
+            'email', st.email,
+            'grades', COALESCE(
+                json_agg(json_build_object(
+                    'assignment', a.name,
+                    'date', a.date,
+                    'score', g.score,
+                    'max_points', a.max_points,
+                    'teacher', t.name,
+                    'tags', COALESCE(at.tags, '[]'::json)
+                ) ORDER BY a.date, a.name) FILTER (WHERE g.id IS NOT NULL),
+                '[]'::json
+            )
+        ) AS student
+        FROM students st
+        LEFT JOIN grades g ON g.student_id = st.id
+        LEFT JOIN assignments a ON a.id = g.assignment_id
+        LEFT JOIN teachers t ON t.id = g.teacher_id
+        LEFT JOIN (
+            SELECT assignment_tags.assignment_id, json_agg(tags.name) AS tags
+            FROM assignment_tags
+            JOIN tags ON tags.id = assignment_tags.tag_id
+            WHERE tags.tenant_id = :tenant_id
+            GROUP BY assignment_tags.assignment_id
+        ) at ON at.assignment_id = a.id
+        WHERE st.tenant_id = :tenant_id
+        GROUP BY st.id
+    ) s
+""")
 
 
 class StudentService:
     """Service for managing student operations"""
     
     def __init__(self, db: Session = None):
-        self.db = db or next(get_db())
+        self.db = db or SessionLocal()
     
     def create_student(self, email: str, first_name: str, last_name: str, 
                       student_number: Optional[str] = None) -> Student:
@@ -31,6 +72,55 @@ class StudentService:
         """Get student by email"""
         return self.db.query(Student).filter(Student.email == email).first()
     
+    def get_data_version_by_tenant(self, tenant_id: str) -> Optional[int]:
+        """
+        Get the tenant's data version. Every write to the tenant's students,
+        assignments or grades bumps it, so it can key cached grade views.
+        """
+        return self.db.scalar(select(Tenant.data_version).where(Tenant.id == tenant_id))
+    
+    def bump_data_version_by_tenant(self, tenant_id: str) -> None:
+        """
+        Bump the tenant's data version. Call it in the same transaction as the
+        write it covers, so the new version becomes visible with the new data.
+        """
+        self.db.execute(
+            update(Tenant)
+            .where(Tenant.id == tenant_id)
+            .values(data_version=Tenant.data_version + 1)
+        )
+    
+    def get_grades_table_json_by_tenant(self, tenant_id: str) -> str:
+        """
+        Get the grades table for a tenant as a JSON document built by
+        PostgreSQL, so no ORM objects are created for the tenant's grades
+        """
+        return self.db.execute(GRADES_TABLE_JSON_SQL, {"tenant_id": tenant_id}).scalar()
+    
+    def get_dashboard_stats_by_tenant(self, tenant_id: str) -> Dict[str, Any]:
+        """Get a tenant's dashboard counts and class average in one round trip"""
+        def count(model):
+            return (select(func.count())
+                    .select_from(model)
+                    .where(model.tenant_id == tenant_id)
+                    .scalar_subquery())
+        
+        avg_percentage = (select(func.avg(Grade.score * 100.0 / func.nullif(Assignment.max_points, 0)))
+                          .join(Assignment, Grade.assignment_id == Assignment.id)
+                          .where(Grade.tenant_id == tenant_id)
+                          .scalar_subquery())
+        
+        total_students, total_assignments, total_grades, average = self.db.execute(
+            select(count(Student), count(Assignment), count(Grade), avg_percentage)
+        ).one()
+        
+        return {
+            "total_students": total_students,
+            "total_assignments": total_assignments,
+            "total_grades": total_grades,
+            "average_class_percentage": round(float(average or 0), 2)
+        }
+    
     def get_all_students(self) -> List[Student]:
         """Get all students"""
         return self.db.query(Student).all()
@@ -0,0 +1,24 @@
+# utils/validators.py
+
+import re
+from functools import lru_cache
+
+import email_validator
+
+# Cheap structural check for an email address: one @, no whitespace, a dot
+# in the domain. Compiled once so it can run over a whole column with
+# Series.str.match.
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+@lru_cache(maxsize=100_000)
+def validate_email(email: str) -> bool:
+    """
+    Full syntax check of an email address, without DNS or MX lookups.
+    Cached, since the same addresses come back on every re-upload.
+    """
+    try:
+        email_validator.validate_email(email, check_deliverability=False)
+    except email_validator.EmailNotValidError:
+        return False
+    return True